@@ -1,8 +1,8 @@
 // --- File: netlify/functions/ado_webhook.mts ---
 
 import type { Handler, HandlerEvent, HandlerContext } from "@netlify/functions";
-import fetch from "node-fetch"; // Using node-fetch v3 for ESM compatibility
-import { Buffer } from "node:buffer"; // For Base64 decoding
+import { Buffer } from "node:buffer"; // For Base64 encoding/decoding
+import { createHash, timingSafeEqual } from "node:crypto";
 
 // --- Environment Variables & Constants ---
 // Required: Set these Webhook URLs and ADO credentials in Netlify Env Vars
@@ -12,15 +12,117 @@ const GOOGLE_CHAT_WEBHOOK_JUSTIN = process.env.GOOGLE_CHAT_WEBHOOK_JUSTIN;
 const GOOGLE_CHAT_WEBHOOK_EFFORT = process.env.GOOGLE_CHAT_WEBHOOK_EFFORT;
 const ADO_WEBHOOK_USER = process.env.ADO_WEBHOOK_USER;
 const ADO_WEBHOOK_PASS = process.env.ADO_WEBHOOK_PASS; // Use PAT for better security
+// Optional: set ADO_WEBHOOK_DEBUG=true to log payload excerpts and bodies
+const ADO_WEBHOOK_DEBUG = process.env.ADO_WEBHOOK_DEBUG === "true";
+// Expected Basic Auth token ("user:pass" in Base64), encoded once per container
+const EXPECTED_AUTH_TOKEN =
+  ADO_WEBHOOK_USER && ADO_WEBHOOK_PASS
+    ? Buffer.from(`${ADO_WEBHOOK_USER}:${ADO_WEBHOOK_PASS}`, "utf-8").toString(
+        "base64"
+      )
+    : null;
+const BASIC_AUTH_PREFIX = "basic ";
 
 // Hardcoded User IDs (as per previous code structure + new ID for Justin)
 const CHAT_USER_ID_HANS = "110089480014983777747";
 const CHAT_USER_ID_ALEXIS = "111538330948035296439";
 const CHAT_USER_ID_JUSTIN = "114126982067491484128";
 
+// Link extraction patterns, compiled once per container rather than per event
+const MD_LINK_RE = /\[[^\]]*\]\(([^)]*)\)/;
+const HTML_HREF_RE = /<a href="([^"]*)">/;
+
+// Fixed parts of the comment card
+const COMMENT_CARD_ICON_URL =
+  "https://img.icons8.com/color/48/000000/comments.png";
+const COMMENT_CARD_IMAGE_TYPE = "CIRCLE" as const;
+const VIEW_WORK_ITEM_BUTTON_TEXT = "View Work Item";
+
+// Comment strings that route a notification (checked in this priority order)
+const EFFORT_STRING = "Please review the total effort"; // Removed period
+const TAG_HANS = "@Hans Stechl2";
+const TAG_ALEXIS = "@Alexis Aguirre";
+const TAG_JUSTIN = "@Justin Burniske";
+
+// Google Chat posts use the runtime's built-in fetch, whose global dispatcher
+// keeps connections alive across warm invocations
+const CHAT_REQUEST_HEADERS = {
+  "Content-Type": "application/json; charset=UTF-8",
+};
+// Upper bound on how long the ADO caller waits on Google Chat. The send can't
+// be left running after we respond (Netlify freezes the container once the
+// handler returns), so cap it instead.
+const CHAT_SEND_TIMEOUT_MS = 5000;
+
+// Largest webhook body accepted (1 MiB of text; ADO payloads are far smaller).
+// Base64-delivered bodies are checked against their encoded length.
+const MAX_BODY_LENGTH = 1_048_576;
+const MAX_BODY_BASE64_LENGTH = Math.ceil(MAX_BODY_LENGTH / 3) * 4;
+
+// Fixed handler response bodies, serialized once per container
+const BODY_METHOD_NOT_ALLOWED = JSON.stringify({
+  status: "error",
+  message: "Method Not Allowed",
+});
+const BODY_AUTH_REQUIRED = JSON.stringify({
+  status: "error",
+  message: "Authentication Required",
+});
+const BODY_NO_TARGET_URL = JSON.stringify({
+  status: "error",
+  message: "Webhook processor configuration error (No Target URL)",
+});
+const BODY_NOTIFICATION_SENT = JSON.stringify({
+  status: "success",
+  message: "Webhook received and notification sent",
+});
+const BODY_NOTIFICATION_FAILED = JSON.stringify({
+  status: "error",
+  message: "Webhook received but failed to send notification to Google Chat",
+});
+const BODY_NO_NOTIFICATION = JSON.stringify({
+  status: "success",
+  message: "Webhook received, no notification required/sent",
+});
+const BODY_DUPLICATE_DELIVERY = JSON.stringify({
+  status: "success",
+  message: "Webhook received, duplicate delivery ignored",
+});
+const BODY_TOO_LARGE = JSON.stringify({
+  status: "error",
+  message: "Payload Too Large",
+});
+const BODY_INTERNAL_ERROR = JSON.stringify({
+  status: "error",
+  message: "Internal Server Error processing webhook",
+});
+
+// Shared stand-in for missing payload sections, so lookups on absent
+// message/resource/fields don't allocate a fresh {} per event
+const EMPTY_RECORD: Readonly<Record<string, any>> = Object.freeze({});
+
+// Deliveries that already produced a Google Chat message, mapped to when they
+// were sent, so ADO retries of the same notification don't post twice
+const SENT_DELIVERIES = new Map<string, number>();
+const SENT_DELIVERIES_MAX = 512;
+const SENT_DELIVERY_TTL_MS = 10 * 60 * 1000;
+
+// Entities decoded by sanitizeCommentHtml, matched in a single scan
+const HTML_ENTITY_RE = /&(?:lt|gt|amp|quot|#39);/g;
+const HTML_ENTITIES: Readonly<Record<string, string>> = {
+  "&lt;": "<",
+  "&gt;": ">",
+  "&amp;": "&",
+  "&quot;": '"',
+  "&#39;": "'",
+};
+
 // --- Types ---
 interface AdoPayload {
+  id?: string;
   eventType?: string;
+  subscriptionId?: string;
+  notificationId?: number;
   message?: { markdown?: string; html?: string; text?: string };
   detailedMessage?: { markdown?: string; html?: string; text?: string };
   resource?: any;
@@ -67,18 +169,57 @@ function sanitizeCommentHtml(html: string): string {
   text = text.replace(/&nbsp;/gi, " ");
   // 3. Strip all *other* HTML tags (<a...>, <span>, etc.)
   text = text.replace(/<[^>]*>/g, "");
-  // 4. Decode other common HTML entities
-  text = text
-    .replace(/&lt;/g, "<")
-    .replace(/&gt;/g, ">")
-    .replace(/&amp;/g, "&")
-    .replace(/&quot;/g, '"')
-    .replace(/&#39;/g, "'");
+  // 4. Decode other common HTML entities (one pass over the text)
+  text = text.replace(HTML_ENTITY_RE, (entity) => HTML_ENTITIES[entity]);
   // 5. Consolidate multiple newlines into one and trim
   text = text.replace(/(\n\s*)+/g, "\n");
   return text.trim();
 }
 
+// --- Helper for Verbose Diagnostics ---
+// Takes console-style format arguments so nothing is interpolated unless
+// ADO_WEBHOOK_DEBUG is on.
+function debugLog(message: string, ...args: unknown[]): void {
+  if (ADO_WEBHOOK_DEBUG) console.log(message, ...args);
+}
+
+// --- Helper for Constant-Time Credential Comparison ---
+// Both sides are hashed first so timingSafeEqual always sees equal-length
+// buffers and the comparison leaks neither content nor length.
+function safeEqual(a: string, b: string): boolean {
+  const digestA = createHash("sha256").update(a).digest();
+  const digestB = createHash("sha256").update(b).digest();
+  return timingSafeEqual(digestA, digestB);
+}
+
+// --- Helpers to Track Already-Delivered Notifications ---
+// ADO keeps subscriptionId + notificationId stable across retries of one
+// notification; the event id is the fallback when either is missing.
+function deliveryKey(payload: AdoPayload): string | null {
+  if (payload.subscriptionId && payload.notificationId != null) {
+    return `${payload.subscriptionId}:${payload.notificationId}`;
+  }
+  return payload.id ?? null;
+}
+
+function wasRecentlyDelivered(key: string): boolean {
+  const sentAt = SENT_DELIVERIES.get(key);
+  if (sentAt === undefined) return false;
+  if (Date.now() - sentAt > SENT_DELIVERY_TTL_MS) {
+    SENT_DELIVERIES.delete(key);
+    return false;
+  }
+  return true;
+}
+
+function rememberDelivery(key: string): void {
+  SENT_DELIVERIES.set(key, Date.now());
+  if (SENT_DELIVERIES.size > SENT_DELIVERIES_MAX) {
+    // Oldest entry is first in Map iteration order
+    SENT_DELIVERIES.delete(SENT_DELIVERIES.keys().next().value!);
+  }
+}
+
 // --- Helper to Send Message to Google Chat ---
 async function sendToGoogleChat(
   targetWebhookUrl: string | undefined | null,
@@ -90,8 +231,10 @@ async function sendToGoogleChat(
     );
     return false;
   }
-  const headers = { "Content-Type": "application/json; charset=UTF-8" };
   try {
+    // Serialize once; the same string is logged and sent
+    const body = JSON.stringify(messagePayload);
+    debugLog("DEBUG: Sending Payload: %s", body);
     console.log(
       `Attempting to send payload to Google Chat URL: ${targetWebhookUrl.substring(
         0,
@@ -100,8 +243,9 @@ async function sendToGoogleChat(
     );
     const response = await fetch(targetWebhookUrl, {
       method: "POST",
-      headers: headers,
-      body: JSON.stringify(messagePayload),
+      headers: CHAT_REQUEST_HEADERS,
+      body,
+      signal: AbortSignal.timeout(CHAT_SEND_TIMEOUT_MS),
     });
     if (!response.ok) {
       const errorBody = await response.text();
@@ -119,179 +263,225 @@ async function sendToGoogleChat(
   }
 }
 
-// --- MODIFIED Helper to Format ADO Event Card ---
-function formatAdoEventCard(payload: AdoPayload): FormatResult {
-  const eventType = payload.eventType ?? "unknown";
-  const messageData = payload.message ?? {};
-  const resource = payload.resource ?? {};
-  const resourceFields = resource.fields ?? {};
-  let project_name = resourceFields["System.TeamProject"] ?? null;
-  if (!project_name) {
-    project_name =
-      payload.resourceContainers?.project?.name ?? "Unknown Project";
-  }
+// --- Helper to Resolve the Project Name (shared by all formatters) ---
+function resolveProjectName(payload: AdoPayload): string {
+  return (
+    payload.resource?.fields?.["System.TeamProject"] ||
+    (payload.resourceContainers?.project?.name ?? "Unknown Project")
+  );
+}
+
+// --- Formatter for workitem.commented Events ---
+function formatWorkItemCommented(payload: AdoPayload): FormatResult {
+  const messageData = payload.message ?? EMPTY_RECORD;
+  const resource = payload.resource ?? EMPTY_RECORD;
+  const resourceFields = resource.fields ?? EMPTY_RECORD;
+  const project_name = resolveProjectName(payload);
 
   let cardOrTextPayload: GoogleChatCardPayload | GoogleChatSimpleText | null =
     null;
   let targetUser: TargetUser = null;
 
-  try {
-    if (eventType === "workitem.commented") {
-      const wi_id = resource.id ?? "N/A";
-      const wi_type = resourceFields["System.WorkItemType"] ?? "Work Item";
-      const wi_title = resourceFields["System.Title"] ?? "N/A";
-      const commenter =
-        resourceFields["System.ChangedBy"]?.displayName ?? "Unknown User";
-
-      // --- Corrected Comment Text Extraction ---
-      let comment_text: string | null = null;
-      const history_text = resourceFields["System.History"];
-      if (
-        history_text &&
-        typeof history_text === "string" &&
-        history_text.trim()
-      ) {
-        comment_text = history_text.trim(); // Keep original HTML for now
-        console.log(
-          `DEBUG: Using System.History for comment text. Length: ${
-            comment_text.length
-          }. Excerpt: '${comment_text.substring(0, 70)}...'`
-        );
-      } else {
-        console.warn(
-          `DEBUG WARNING: System.History field missing or empty for WI #${wi_id}. Cannot process comment content.`
-        );
-        comment_text = null;
-      }
-      // --- End Corrected Extraction ---
-
-      let work_item_link = "#";
-      // Extract link
-      const markdown_text = messageData.markdown;
-      if (markdown_text) {
-        const match = markdown_text.match(/\[.*?\]\((.*?)\)/);
-        if (match?.[1]) work_item_link = match[1];
-      }
-      if (work_item_link === "#" && messageData.html) {
-        const match = messageData.html.match(/<a href="(.*?)">/);
-        if (match?.[1]) work_item_link = match[1].replace(/&amp;/g, "&");
-      }
-      if (work_item_link === "#") {
-        work_item_link = resource._links?.html?.href ?? resource.url ?? "#";
-      }
+  const wi_id = resource.id ?? "N/A";
+  const wi_type = resourceFields["System.WorkItemType"] ?? "Work Item";
+  const wi_title = resourceFields["System.Title"] ?? "N/A";
+  const commenter =
+    resourceFields["System.ChangedBy"]?.displayName ?? "Unknown User";
 
-      // --- Check for specific STRINGS or user tags ---
-      if (comment_text) {
-        // Proceed only if comment text was successfully extracted
-        const effortString = "Please review the total effort"; // Removed period
-        const tagHans = "@Hans Stechl2";
-        const tagAlexis = "@Alexis Aguirre";
-        const tagJustin = "@Justin Burniske";
-
-        console.log(`Checking comment for WI #${wi_id}. Using extracted text.`);
-
-        // --- PRIORITY 1: Check for Effort Review String ---
-        if (comment_text.includes(effortString)) {
-          targetUser = "effort";
-          // Use the <users/ID> format for Hans for the effort message
-          const simpleTextMessage = `<users/${CHAT_USER_ID_HANS}> - ${effortString} - ${work_item_link}`;
-          cardOrTextPayload = { text: simpleTextMessage };
-          console.log(
-            `'${effortString}' FOUND in comment for WI #${wi_id}. Target: ${targetUser}.`
-          );
-
-          // --- PRIORITY 2: Check for User Tags (only if effort string wasn't found) ---
-        } else {
-          if (comment_text.includes(tagHans)) {
-            targetUser = "hans";
-            console.log(
-              `Tag '${tagHans}' FOUND in comment for WI #${wi_id}. Target: ${targetUser}`
-            );
-          } else if (comment_text.includes(tagAlexis)) {
-            targetUser = "alexis";
-            console.log(
-              `Tag '${tagAlexis}' FOUND in comment for WI #${wi_id}. Target: ${targetUser}`
-            );
-          } else if (comment_text.includes(tagJustin)) {
-            targetUser = "justin";
-            console.log(
-              `Tag '${tagJustin}' FOUND in comment for WI #${wi_id}. Target: ${targetUser}`
-            );
-          }
-
-          // If one of the user tags was found, format the detailed card
-          if (targetUser) {
-            // --- SANITIZE comment text before putting it in the card ---
-            const sanitizedComment = sanitizeCommentHtml(comment_text);
-            console.log(
-              `DEBUG: Sanitized comment excerpt: '${sanitizedComment.substring(
-                0,
-                70
-              )}...'`
-            );
-
-            const card_header = {
-              title: `New Comment on ${wi_type} #${wi_id}`, // Simplified title
-              subtitle: `${wi_title} | By: ${commenter}`,
-              imageUrl: "https://img.icons8.com/color/48/000000/comments.png",
-              imageType: "CIRCLE" as const,
-            };
-            const widgets: any[] = [
-              { textParagraph: { text: `<b>Project:</b> ${project_name}` } },
-              // Use sanitizedComment here. Google Chat respects \n in textParagraph.
+  // --- Corrected Comment Text Extraction ---
+  let comment_text: string | null = null;
+  const history_text = resourceFields["System.History"];
+  if (
+    history_text &&
+    typeof history_text === "string" &&
+    history_text.trim()
+  ) {
+    comment_text = history_text.trim(); // Keep original HTML for now
+    debugLog(
+      "DEBUG: Using System.History for comment text. Length: %d. Excerpt: '%s...'",
+      comment_text.length,
+      comment_text.substring(0, 70)
+    );
+  } else {
+    console.warn(
+      `DEBUG WARNING: System.History field missing or empty for WI #${wi_id}. Cannot process comment content.`
+    );
+    comment_text = null;
+  }
+  // --- End Corrected Extraction ---
+
+  // --- Check for specific STRINGS or user tags ---
+  // Done before any link parsing: most comments tag nobody, so this is
+  // the common path and should bail out after a few substring checks.
+  if (comment_text) {
+    console.log(`Checking comment for WI #${wi_id}. Using extracted text.`);
+
+    // --- PRIORITY 1: Check for Effort Review String ---
+    if (comment_text.includes(EFFORT_STRING)) {
+      targetUser = "effort";
+      console.log(
+        `'${EFFORT_STRING}' FOUND in comment for WI #${wi_id}. Target: ${targetUser}.`
+      );
+
+      // --- PRIORITY 2: Check for User Tags (only if effort string wasn't found) ---
+    } else if (comment_text.includes(TAG_HANS)) {
+      targetUser = "hans";
+      console.log(
+        `Tag '${TAG_HANS}' FOUND in comment for WI #${wi_id}. Target: ${targetUser}`
+      );
+    } else if (comment_text.includes(TAG_ALEXIS)) {
+      targetUser = "alexis";
+      console.log(
+        `Tag '${TAG_ALEXIS}' FOUND in comment for WI #${wi_id}. Target: ${targetUser}`
+      );
+    } else if (comment_text.includes(TAG_JUSTIN)) {
+      targetUser = "justin";
+      console.log(
+        `Tag '${TAG_JUSTIN}' FOUND in comment for WI #${wi_id}. Target: ${targetUser}`
+      );
+    } else {
+      // Neither effort string nor user tag found
+      console.log(
+        `Neither effort string nor relevant tags found for WI #${wi_id} in extracted text. Skipping notification.`
+      );
+    }
+  } else {
+    // comment_text was null
+    console.error(
+      `Failed to extract valid comment text for WI #${wi_id}. Skipping checks.`
+    );
+  }
+
+  if (comment_text && targetUser) {
+    let work_item_link = "#";
+    // Extract link
+    const markdown_text = messageData.markdown;
+    if (markdown_text) {
+      const match = markdown_text.match(MD_LINK_RE);
+      if (match?.[1]) work_item_link = match[1];
+    }
+    if (work_item_link === "#" && messageData.html) {
+      const match = messageData.html.match(HTML_HREF_RE);
+      if (match?.[1]) work_item_link = match[1].replace(/&amp;/g, "&");
+    }
+    if (work_item_link === "#") {
+      work_item_link = resource._links?.html?.href ?? resource.url ?? "#";
+    }
+
+    if (targetUser === "effort") {
+      // Use the <users/ID> format for Hans for the effort message
+      const simpleTextMessage = `<users/${CHAT_USER_ID_HANS}> - ${EFFORT_STRING} - ${work_item_link}`;
+      cardOrTextPayload = { text: simpleTextMessage };
+    } else {
+      // One of the user tags was found, format the detailed card
+      // --- SANITIZE comment text before putting it in the card ---
+      const sanitizedComment = sanitizeCommentHtml(comment_text);
+      debugLog(
+        "DEBUG: Sanitized comment excerpt: '%s...'",
+        sanitizedComment.substring(0, 70)
+      );
+
+      const card_header = {
+        title: `New Comment on ${wi_type} #${wi_id}`, // Simplified title
+        subtitle: `${wi_title} | By: ${commenter}`,
+        imageUrl: COMMENT_CARD_ICON_URL,
+        imageType: COMMENT_CARD_IMAGE_TYPE,
+      };
+      const widgets: any[] = [
+        { textParagraph: { text: `<b>Project:</b> ${project_name}` } },
+        // Use sanitizedComment here. Google Chat respects \n in textParagraph.
+        {
+          textParagraph: { text: `<b>Comment:</b>\n${sanitizedComment}` },
+        },
+      ];
+      if (work_item_link !== "#") {
+        widgets.push({
+          buttonList: {
+            buttons: [
               {
-                textParagraph: { text: `<b>Comment:</b>\n${sanitizedComment}` },
+                text: VIEW_WORK_ITEM_BUTTON_TEXT,
+                onClick: { openLink: { url: work_item_link } },
               },
-            ];
-            if (work_item_link !== "#") {
-              widgets.push({
-                buttonList: {
-                  buttons: [
-                    {
-                      text: "View Work Item",
-                      onClick: { openLink: { url: work_item_link } },
-                    },
-                  ],
-                },
-              });
-            }
-            const card_id = `comment-wi-${wi_id}-rev-${resource.rev ?? "N/A"}`;
-            cardOrTextPayload = {
-              cardsV2: [
-                {
-                  cardId: card_id,
-                  card: { header: card_header, sections: [{ widgets }] },
-                },
-              ],
-            };
-          } else {
-            // Neither effort string nor user tag found
-            console.log(
-              `Neither effort string nor relevant tags found for WI #${wi_id} in extracted text. Skipping notification.`
-            );
-          }
-        }
-      } else {
-        // comment_text was null
-        console.error(
-          `Failed to extract valid comment text for WI #${wi_id}. Skipping checks.`
-        );
-        targetUser = null;
-        cardOrTextPayload = null;
+            ],
+          },
+        });
       }
-    } else {
-      console.log(`Event type '${eventType}' not handled. Skipping.`);
+      const card_id = `comment-wi-${wi_id}-rev-${resource.rev ?? "N/A"}`;
+      cardOrTextPayload = {
+        cardsV2: [
+          {
+            cardId: card_id,
+            card: { header: card_header, sections: [{ widgets }] },
+          },
+        ],
+      };
+    }
+  }
+
+  return { targetUser, payload: cardOrTextPayload };
+}
+
+// Event type -> formatter. A Map rather than an object literal so a lookup
+// can never resolve to an Object.prototype member.
+const EVENT_FORMATTERS = new Map<
+  string,
+  (payload: AdoPayload) => FormatResult
+>([["workitem.commented", formatWorkItemCommented]]);
+
+// Quoted event type strings; a body containing none of them can't be a
+// handled event, so the handler skips parsing it
+const HANDLED_EVENT_MARKERS = Array.from(
+  EVENT_FORMATTERS.keys(),
+  (eventType) => `"${eventType}"`
+);
+
+// Recently formatted results keyed by event type + work item id + revision,
+// least recently used first
+const FORMAT_CACHE = new Map<string, FormatResult>();
+const FORMAT_CACHE_MAX = 256;
+
+// --- MODIFIED Helper to Format ADO Event Card ---
+function formatAdoEventCard(payload: AdoPayload): FormatResult {
+  const eventType = payload.eventType ?? "unknown";
+  const formatter = EVENT_FORMATTERS.get(eventType);
+  if (!formatter) {
+    console.log(`Event type '${eventType}' not handled. Skipping.`);
+    return { targetUser: null, payload: null };
+  }
+
+  // ADO redelivers the same revision on retries; reuse the earlier result
+  const resource = payload.resource;
+  const cacheKey =
+    resource?.id != null && resource?.rev != null
+      ? `${eventType}|${resource.id}|${resource.rev}`
+      : null;
+  if (cacheKey) {
+    const cached = FORMAT_CACHE.get(cacheKey);
+    if (cached) {
+      // Re-insert so Map order tracks recency
+      FORMAT_CACHE.delete(cacheKey);
+      FORMAT_CACHE.set(cacheKey, cached);
+      console.log(`Reusing formatted result for ${cacheKey}.`);
+      return cached;
     }
+  }
+
+  try {
+    const result = formatter(payload);
+    if (cacheKey) {
+      FORMAT_CACHE.set(cacheKey, result);
+      if (FORMAT_CACHE.size > FORMAT_CACHE_MAX) {
+        // Oldest entry is first in Map iteration order
+        FORMAT_CACHE.delete(FORMAT_CACHE.keys().next().value!);
+      }
+    }
+    return result;
   } catch (error) {
     console.error(
       `Error during formatAdoEventCard for event ${eventType}: ${error}`
     );
-    targetUser = null;
-    cardOrTextPayload = null;
+    return { targetUser: null, payload: null };
   }
-
-  // Return the result object
-  return { targetUser, payload: cardOrTextPayload };
 }
 
 // --- Netlify Function Handler ---
@@ -305,57 +495,29 @@ export const handler: Handler = async (
     console.warn(`Received non-POST request: ${event.httpMethod}`);
     return {
       statusCode: 405,
-      body: JSON.stringify({ status: "error", message: "Method Not Allowed" }),
+      body: BODY_METHOD_NOT_ALLOWED,
     };
   }
 
   // --- Security Validation: Basic Authentication ---
   let authPassed = false;
   const authHeader = event.headers.authorization || event.headers.Authorization;
-  if (ADO_WEBHOOK_USER && ADO_WEBHOOK_PASS) {
-    if (authHeader && authHeader.toLowerCase().startsWith("basic ")) {
-      try {
-        console.log("Attempting Basic Auth decoding.");
-        const parts = authHeader.split(" ", 2);
-        if (parts.length === 2) {
-          const encodedCredentials = parts[1];
-          if (encodedCredentials && typeof encodedCredentials === "string") {
-            const decodedCredentials = Buffer.from(
-              encodedCredentials,
-              "base64"
-            ).toString("utf-8");
-            const credentialParts = decodedCredentials.split(":", 2);
-            if (credentialParts.length === 2) {
-              const username = credentialParts[0];
-              const password = credentialParts[1];
-              if (
-                username === ADO_WEBHOOK_USER &&
-                password === ADO_WEBHOOK_PASS
-              ) {
-                console.log("Basic Authentication successful.");
-                authPassed = true;
-              } else {
-                console.warn(
-                  "Basic Authentication failed: Credentials mismatch."
-                );
-              }
-            } else {
-              console.warn(
-                "Basic Authentication failed: Decoded credentials format invalid (missing colon?)."
-              );
-            }
-          } else {
-            console.warn(
-              "Basic Authentication failed: Encoded credentials part is empty or not a string."
-            );
-          }
-        } else {
-          console.warn(
-            "Basic Authentication failed: Authorization header format invalid (missing space?)."
-          );
-        }
-      } catch (error) {
-        console.error(`Error decoding/parsing Basic Auth header: ${error}`);
+  if (EXPECTED_AUTH_TOKEN) {
+    // Scheme is case-insensitive; lowercase just the prefix, not the token
+    if (
+      authHeader &&
+      authHeader.slice(0, BASIC_AUTH_PREFIX.length).toLowerCase() ===
+        BASIC_AUTH_PREFIX
+    ) {
+      // Compare the encoded token as-is; nothing to decode or split per request
+      const encodedCredentials = authHeader
+        .slice(BASIC_AUTH_PREFIX.length)
+        .trim();
+      if (safeEqual(encodedCredentials, EXPECTED_AUTH_TOKEN)) {
+        console.log("Basic Authentication successful.");
+        authPassed = true;
+      } else {
+        console.warn("Basic Authentication failed: Credentials mismatch.");
       }
     } else {
       console.warn(
@@ -372,10 +534,7 @@ export const handler: Handler = async (
     console.error("Webhook Authentication Failed.");
     return {
       statusCode: 401,
-      body: JSON.stringify({
-        status: "error",
-        message: "Authentication Required",
-      }),
+      body: BODY_AUTH_REQUIRED,
     };
   }
   // --- End Security Validation ---
@@ -398,20 +557,67 @@ export const handler: Handler = async (
     );
     return {
       statusCode: 500,
-      body: JSON.stringify({
-        status: "error",
-        message: "Webhook processor configuration error (No Target URL)",
-      }),
+      body: BODY_NO_TARGET_URL,
     };
   }
 
   // --- Process Payload if Auth Passed ---
   try {
-    const payloadString = event.body ?? "{}";
+    // Bound parse cost: reject oversized bodies before decoding or parsing
+    const rawBody = event.body ?? "{}";
+    const maxRawLength = event.isBase64Encoded
+      ? MAX_BODY_BASE64_LENGTH
+      : MAX_BODY_LENGTH;
+    if (rawBody.length > maxRawLength) {
+      console.warn(
+        `Rejecting webhook body of length ${rawBody.length} (limit ${maxRawLength}).`
+      );
+      return {
+        statusCode: 413,
+        body: BODY_TOO_LARGE,
+      };
+    }
+    const payloadString = event.isBase64Encoded
+      ? Buffer.from(rawBody, "base64").toString("utf-8")
+      : rawBody;
+    // Bodies with no handled event marker are acknowledged unparsed. That
+    // includes malformed JSON, which therefore gets a 200 here rather than
+    // the 500 + Chat error alert from the parse failure path below.
+    if (
+      !HANDLED_EVENT_MARKERS.some((marker) => payloadString.includes(marker))
+    ) {
+      console.log(
+        `Raw body (length ${payloadString.length}) has no handled event type marker; acknowledging without parsing (body may be another event type or malformed).`
+      );
+      return {
+        statusCode: 200,
+        body: BODY_NO_NOTIFICATION,
+      };
+    }
     const payload: AdoPayload = JSON.parse(payloadString);
     const eventTypeReceived = payload.eventType ?? "unknown";
     console.log(`Webhook received for event type: ${eventTypeReceived}`);
 
+    // The raw-body prefilter is only a hint; confirm against the parsed type
+    if (!EVENT_FORMATTERS.has(eventTypeReceived)) {
+      console.log(`Event type '${eventTypeReceived}' not handled. Skipping.`);
+      return {
+        statusCode: 200,
+        body: BODY_NO_NOTIFICATION,
+      };
+    }
+
+    const delivery = deliveryKey(payload);
+    if (delivery && wasRecentlyDelivered(delivery)) {
+      console.log(
+        `Duplicate delivery ${delivery} already notified. Skipping notification.`
+      );
+      return {
+        statusCode: 200,
+        body: BODY_DUPLICATE_DELIVERY,
+      };
+    }
+
     console.log(
       `Formatting message for Google Chat (if applicable) for ${eventTypeReceived}...`
     );
@@ -437,14 +643,9 @@ export const handler: Handler = async (
     // Send notification ONLY if a target was identified, a payload was formatted, AND a URL exists for that target
     if (targetWebhookUrl && formatResult.payload) {
       // Log the payload BEING SENT (useful if sanitization has issues)
-      console.log(
-        `DEBUG: Payload type determined: ${
-          formatResult.targetUser === "effort" ? "SimpleText" : "CardV2"
-        }`
-      );
-      console.log(
-        "DEBUG: Sending Payload:",
-        JSON.stringify(formatResult.payload, null, 2)
+      debugLog(
+        "DEBUG: Payload type determined: %s",
+        formatResult.targetUser === "effort" ? "SimpleText" : "CardV2"
       );
 
       console.log(
@@ -458,21 +659,15 @@ export const handler: Handler = async (
       );
 
       if (sendSuccess) {
+        if (delivery) rememberDelivery(delivery);
         return {
           statusCode: 200,
-          body: JSON.stringify({
-            status: "success",
-            message: "Webhook received and notification sent",
-          }),
+          body: BODY_NOTIFICATION_SENT,
         };
       } else {
         return {
           statusCode: 500,
-          body: JSON.stringify({
-            status: "error",
-            message:
-              "Webhook received but failed to send notification to Google Chat",
-          }),
+          body: BODY_NOTIFICATION_FAILED,
         };
       }
     } else {
@@ -482,10 +677,7 @@ export const handler: Handler = async (
       );
       return {
         statusCode: 200,
-        body: JSON.stringify({
-          status: "success",
-          message: "Webhook received, no notification required/sent",
-        }),
+        body: BODY_NO_NOTIFICATION,
       };
     }
   } catch (error) {
@@ -504,10 +696,7 @@ export const handler: Handler = async (
     );
     return {
       statusCode: 500,
-      body: JSON.stringify({
-        status: "error",
-        message: "Internal Server Error processing webhook",
-      }),
+      body: BODY_INTERNAL_ERROR,
     };
   }
 };